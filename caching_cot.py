@@ -1,7 +1,7 @@
 import warnings
 warnings.filterwarnings("ignore")
 from typing import List, Optional, Dict, Tuple
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import sys
 import os
 import time
@@ -29,8 +29,13 @@ The implementation combines:
 
 class MenuResponse(BaseModel):
     """Model for the chatbot's response"""
-    reasoning_steps: List[str]
-    final_response: str
+    reasoning_steps: List[str] = Field(..., min_length=1, max_length=5)
+    # Structured Outputs doesn't enforce string lengths, so the limit is stated in the description
+    final_response: str = Field(..., description="Short, concise answer of at most 400 characters")
+
+# Upper bound on generated tokens per menu response; output is billed at a higher
+# rate than input and decoding is sequential, so this caps both cost and latency
+MAX_COMPLETION_TOKENS = 350
 
 # Delimiters for our prompts
 menu_delimiter = "<menu_items>"
@@ -39,14 +44,9 @@ menu_delimiter_end = "</menu_items>"
 # Get comprehensive menu data with detailed descriptions
 food_items = get_menu_items()
 
-def get_menu_response(query: str) -> Tuple[MenuResponse, Dict, float]:
-    """
-    Process a user query about the menu using chain of thought reasoning and caching.
-    The system message and prompt are designed to exceed 1024 tokens for effective caching.
-    Returns:
-        Tuple containing (MenuResponse, cache_info dict, latency in seconds)
-    """
-    system_message = f"""
+# Built once at import so every request sends a byte-identical prefix, which is what
+# OpenAI's prompt cache matches on. Only the user query varies and it is always sent last.
+SYSTEM_MESSAGE = f"""
     You are an expert culinary consultant and menu (delimited by {menu_delimiter}{menu_delimiter_end}) specialist with deep knowledge of:
     
     1. Menu Organization and Structure:
@@ -113,31 +113,43 @@ def get_menu_response(query: str) -> Tuple[MenuResponse, Dict, float]:
     - Maintain professional tone
 
     The final response should be short and concise. 
+    Each user message is a customer query about our menu offerings; analyze it using the steps above.
     """
 
-    # Detailed prompt that includes comprehensive context for better caching
-    prompt = f"""
-    Please analyze the following customer query about our menu offerings:
-    Query: {query}
-    """
+# Routes requests sharing SYSTEM_MESSAGE to the same cache server
+PROMPT_CACHE_KEY = "menu_query_v1"
 
+def get_menu_response(query: str, demo_mode: bool = False) -> Tuple[Optional[MenuResponse], Dict, float]:
+    """
+    Process a user query about the menu using chain of thought reasoning and caching.
+    The system message is designed to exceed 1024 tokens for effective caching.
+    With demo_mode, only a single output token is requested: the prompt is still processed
+    (and cached) in full, so the latency approximates time to first token and no response is parsed.
+    Returns:
+        Tuple containing (MenuResponse or None in demo_mode, cache_info dict, latency in seconds)
+    """
     # Start timing
     start_time = time.time()
     
     # Get response with cache tracking
-    response, cache_info = get_structured_output_with_cache_info(
-        prompt, system_message, MenuResponse, "menu_query"
+    response, cache_info = get_structured_output(
+        query, SYSTEM_MESSAGE, MenuResponse, "menu_query", return_cache_info=True, prompt_cache_key=PROMPT_CACHE_KEY,
+        max_completion_tokens=1 if demo_mode else MAX_COMPLETION_TOKENS
     )
     
     # Calculate latency
     latency = time.time() - start_time
     
     # Display cache information with latency
-    display_cache_info("Menu Query", cache_info, latency)
+    display_cache_info("Menu Query", cache_info, latency, latency_label="Time to First Token" if demo_mode else "Response Time")
+    
+    # Only the demo probe is meant to come back without an answer
+    if response is None and cache_info and not demo_mode:
+        print(f"⚠️  No answer: the response was cut off at {MAX_COMPLETION_TOKENS} tokens or refused")
     
     return response, cache_info, latency
 
-def display_cache_info(query_type: str, cache_info: dict, latency: float = None):
+def display_cache_info(query_type: str, cache_info: dict, latency: float = None, latency_label: str = "Response Time"):
     """Display cache hit information and latency in a readable format"""
     if not cache_info:
         print(f"❓ No cache information available for {query_type}")
@@ -145,17 +157,21 @@ def display_cache_info(query_type: str, cache_info: dict, latency: float = None)
         
     total_tokens = cache_info.get('total_prompt_tokens', 0)
     cached_tokens = cache_info.get('cached_tokens', 0)
+    cache_write_tokens = cache_info.get('cache_write_tokens', 0)
     cache_hit_ratio = cache_info.get('cache_hit_ratio', 0)
     is_cache_hit = cache_info.get('is_cache_hit', False)
     
     cache_status = "🟢 HIT" if is_cache_hit else "🔴 MISS"
     print(f"\n📊 Cache Status for {query_type}:")
-    print(f"   {cache_status} | Total Tokens: {total_tokens} | Cached Tokens: {cached_tokens} | Hit Ratio: {cache_hit_ratio:.2%}")
+    print(f"   {cache_status} | Total Tokens: {total_tokens} | Cache Read: {cached_tokens} | Cache Write: {cache_write_tokens} | Hit Ratio: {cache_hit_ratio:.2%}")
     if latency is not None:
-        print(f"   ⏱️  Response Time: {latency:.2f} seconds")
+        print(f"   ⏱️  {latency_label}: {latency:.2f} seconds")
 
-def run_demo():
-    """Run a demonstration of the prompt caching feature"""
+def run_demo(demo_mode: bool = True):
+    """Run a demonstration of the prompt caching feature
+    With demo_mode, the second run only probes the cache with 1-token requests instead of
+    paying again for answers that were already shown in the first run.
+    """
     print("🤖 Welcome to the Menu Assistant!")
     print("=" * 70)
     
@@ -171,6 +187,7 @@ def run_demo():
     # Store latencies for comparison
     first_run_latencies = []
     second_run_latencies = []
+    second_run_hit_ratios = []
     
     print("\n🔄 FIRST RUN - Expect cache misses")
     print("=" * 70)
@@ -190,8 +207,9 @@ def run_demo():
     print("\n🧪 Running the same queries again to demonstrate cache hits...")
     for question in test_questions:
         print(f"\n❓ Question: {question}")
-        response, cache_info, latency = get_menu_response(question)
+        response, cache_info, latency = get_menu_response(question, demo_mode=demo_mode)
         second_run_latencies.append(latency)
+        second_run_hit_ratios.append(cache_info.get('cache_hit_ratio', 0))
         if response:
             print("\n🤔 Reasoning Steps:")
             for i, step in enumerate(response.reasoning_steps, 1):
@@ -202,13 +220,18 @@ def run_demo():
     # Display latency comparison
     avg_first_run = mean(first_run_latencies)
     avg_second_run = mean(second_run_latencies)
-    improvement = ((avg_first_run - avg_second_run) / avg_first_run) * 100
     
     print("\n⏱️  LATENCY COMPARISON")
     print("=" * 70)
     print(f"Average First Run (Potentially with missed cache hits): {avg_first_run:.2f} seconds")
-    print(f"Average Second Run (Mostly cache hits): {avg_second_run:.2f} seconds")
-    print(f"Performance Improvement: {improvement:.1f}%")
+    if demo_mode:
+        # Second run skipped decoding, so it is not comparable with the full first-run responses
+        print(f"Average Second Run Time to First Token (Mostly cache hits): {avg_second_run:.2f} seconds")
+    else:
+        print(f"Average Second Run (Mostly cache hits): {avg_second_run:.2f} seconds")
+        improvement = ((avg_first_run - avg_second_run) / avg_first_run) * 100
+        print(f"Performance Improvement: {improvement:.1f}%")
+    print(f"Average Second Run Cache Hit Ratio: {mean(second_run_hit_ratios):.2%}")
 
 if __name__ == "__main__":
     run_demo()
@@ -1,78 +1,103 @@
-import openai
-import json
+import orjson
+import numpy as np
 from typing import List, Dict
+from collections import defaultdict
+from functools import lru_cache
 import os
 from dotenv import load_dotenv
+from utils import client, extract_cache_info
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = openai.OpenAI()
-
-# Menu data
-MENU_ITEMS = {
-    "Mini Cheeseburger": {"price": 6.99, "category": "Kids Menu", "vegan": False},
-    "Loaded Potato Skins": {"price": 8.99, "category": "Appetizers", "vegan": False},
-    "Bruschetta": {"price": 7.99, "category": "Appetizers", "vegan": True},
-    "Grilled Chicken Caesar Salad": {"price": 12.99, "category": "Main Menu", "vegan": False},
-    "Classic Cheese Pizza": {"price": 10.99, "category": "Main Menu", "vegan": False},
-    "Spaghetti Bolognese": {"price": 14.99, "category": "Main Menu", "vegan": False},
-    "Veggie Wrap": {"price": 9.99, "category": "Vegan Options", "vegan": True},
-    "Vegan Beyond Burger": {"price": 11.99, "category": "Vegan Options", "vegan": True},
-    "Chocolate Lava Cake": {"price": 6.99, "category": "Desserts", "vegan": False},
-    "Fresh Berry Parfait": {"price": 5.99, "category": "Desserts", "vegan": True}
-}
+# Menu data, stored as parallel arrays indexed through MENU_INDEX
+MENU_NAMES = [
+    "Mini Cheeseburger",
+    "Loaded Potato Skins",
+    "Bruschetta",
+    "Grilled Chicken Caesar Salad",
+    "Classic Cheese Pizza",
+    "Spaghetti Bolognese",
+    "Veggie Wrap",
+    "Vegan Beyond Burger",
+    "Chocolate Lava Cake",
+    "Fresh Berry Parfait",
+]
+MENU_PRICES = np.array([6.99, 8.99, 7.99, 12.99, 10.99, 14.99, 9.99, 11.99, 6.99, 5.99])
+MENU_CATEGORIES = [
+    "Kids Menu",
+    "Appetizers",
+    "Appetizers",
+    "Main Menu",
+    "Main Menu",
+    "Main Menu",
+    "Vegan Options",
+    "Vegan Options",
+    "Desserts",
+    "Desserts",
+]
+MENU_VEGAN = np.array([False, False, True, False, False, False, True, True, False, True])
+MENU_INDEX = {name: i for i, name in enumerate(MENU_NAMES)}
 
 def calculate_total(items: List[str]) -> Dict:
     """Calculate the total price for the given items"""
-    total = 0
-    found_items = {}
-    not_found_items = []
+    idxs = [MENU_INDEX[item] for item in items if item in MENU_INDEX]
+    not_found_items = [item for item in items if item not in MENU_INDEX]
     
-    for item in items:
-        if item in MENU_ITEMS:
-            total += MENU_ITEMS[item]["price"]
-            found_items[item] = {
-                "price": MENU_ITEMS[item]["price"],
-                "category": MENU_ITEMS[item]["category"],
-                "vegan": MENU_ITEMS[item]["vegan"]
-            }
-        else:
-            not_found_items.append(item)
+    found_items = {
+        MENU_NAMES[i]: {
+            "price": float(MENU_PRICES[i]),
+            "category": MENU_CATEGORIES[i],
+            "vegan": bool(MENU_VEGAN[i])
+        }
+        for i in idxs
+    }
     
     return {
-        "total": round(total, 2),
+        "total": round(float(MENU_PRICES[idxs].sum()), 2),
         "found_items": found_items,
         "not_found_items": not_found_items
     }
 
+# Tool definitions are sent ahead of the messages, so they are part of the cached prefix
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "calculate_total",
+            "description": "Calculate the total price for a list of menu items",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "items": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "List of exact menu item names to calculate total for"
+                    }
+                },
+                "required": ["items"]
+            }
+        }
+    }
+]
+
+# Routes every turn of the chat to the same prompt cache
+PROMPT_CACHE_KEY = "fc_chatbot_menu"
+
 def chat_completion(messages: List[Dict]) -> str:
     """Get chat completion from OpenAI API"""
     response = client.chat.completions.create(
         model="gpt-4o",
         messages=messages,
-        tools=[
-            {
-                "type": "function",
-                "function": {
-                    "name": "calculate_total",
-                    "description": "Calculate the total price for a list of menu items",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "items": {
-                                "type": "array",
-                                "items": {"type": "string"},
-                                "description": "List of exact menu item names to calculate total for"
-                            }
-                        },
-                        "required": ["items"]
-                    }
-                }
-            }
-        ]
+        tools=TOOLS,
+        prompt_cache_key=PROMPT_CACHE_KEY
     )
+    
+    # Log how much of the prompt was served from cache on this turn
+    cache_info = extract_cache_info(response.usage)
+    if cache_info:
+        print(f"📊 Cache Read: {cache_info['cached_tokens']} | Cache Write: {cache_info['cache_write_tokens']} | Total Prompt Tokens: {cache_info['total_prompt_tokens']} | Hit Ratio: {cache_info['cache_hit_ratio']:.2%}")
+    
     return response.choices[0].message
 
 def handle_function_calls(message, messages):
@@ -85,7 +110,7 @@ def handle_function_calls(message, messages):
     
     for tool_call in message.tool_calls:
         function_name = tool_call.function.name
-        function_args = json.loads(tool_call.function.arguments)
+        function_args = orjson.loads(tool_call.function.arguments)
         
         if function_name == "calculate_total":
             print("Calling Tool: calculate_total()...")
@@ -95,40 +120,30 @@ def handle_function_calls(message, messages):
     messages.append({
         "role": "function",
         "name": message.tool_calls[0].function.name,
-        "content": json.dumps(function_response)
+        "content": orjson.dumps(function_response).decode()
     })
     
     # Get the final response from the assistant
     final_response = chat_completion(messages)
     return final_response.content
 
+@lru_cache(maxsize=1)
 def format_menu_for_prompt():
     """Format the menu items for inclusion in the system prompt"""
-    menu_text = "MENU ITEMS:\n"
-    
-    categories = {}
-    for item, details in MENU_ITEMS.items():
-        category = details["category"]
-        if category not in categories:
-            categories[category] = []
+    categories = defaultdict(list)
+    for item, price, category, vegan in zip(MENU_NAMES, MENU_PRICES, MENU_CATEGORIES, MENU_VEGAN):
         categories[category].append(
-            f"- {item}: ${details['price']:.2f} {'(Vegan)' if details['vegan'] else ''}"
+            f"- {item}: ${price:.2f} {'(Vegan)' if vegan else ''}"
         )
     
-    for category, items in categories.items():
-        menu_text += f"\n{category}:\n"
-        menu_text += "\n".join(items) + "\n"
-    
-    return menu_text
+    sections = [f"\n{category}:\n" + "\n".join(items) + "\n" for category, items in categories.items()]
+    return "MENU ITEMS:\n" + "".join(sections)
 
-def main():
-    # Format menu for inclusion in the prompt
-    menu_text = format_menu_for_prompt()
-    
-    messages = [
-        {
-            "role": "system",
-            "content": f"""You are a friendly restaurant chatbot that helps customers with their orders.
+# Format menu for inclusion in the prompt once, at import
+menu_text = format_menu_for_prompt()
+
+# System prompt is built once so every request in the chat loop sends identical bytes
+SYSTEM_MESSAGE = f"""You are a friendly restaurant chatbot that helps customers with their orders.
             Below is our complete menu. Please use these exact item names when calling the calculate_total function.
             
             {menu_text}
@@ -142,6 +157,12 @@ def main():
             use your judgment to match it to the closest menu item. Then use that exact menu item name 
             when calling the calculate_total function.
             """
+
+def main():
+    messages = [
+        {
+            "role": "system",
+            "content": SYSTEM_MESSAGE
         }
     ]
     
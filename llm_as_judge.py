@@ -4,12 +4,20 @@ from typing import List, Dict, Tuple, Optional, Any
 import sys
 import os
 import time
-import json
+import orjson
+import asyncio
 import pandas as pd
 import ast
-from statistics import mean
 import csv
-from utils import get_chat_completion, get_reasoning_response
+import pickle
+import glob
+import hashlib
+import functools
+import diskcache
+import tiktoken
+from statistics import mean
+from pydantic import BaseModel
+from utils import aget_parsed_completion, aget_reasoning_response
 
 """
 Implements LLM-as-a-judge workflow with metaprompting for iterative prompt improvement
@@ -39,6 +47,64 @@ prompt_delimiter_end = "</prompt>"
 eval_delimiter = "<evaluation>"
 eval_delimiter_end = "</evaluation>"
 
+# Fixed judging instructions shared by every evaluation; the sample being judged is appended after it
+JUDGE_PREFIX = f"""Your task is to evaluate how well the prediction matches the gold labels for extracting model names from a machine learning paper abstract.
+The abstract, prediction and gold labels are given at the end, delimited by {abstract_delimiter}{abstract_delimiter_end}, {prediction_delimiter}{prediction_delimiter_end} and {gold_delimiter}{gold_delimiter_end}.
+
+Evaluation criteria:
+1. Precision: Are all predicted model names actually present in the abstract and are they actual model names? 
+2. Recall: Did the prediction capture all model names in the abstract?
+3. Accuracy: Did the prediction correctly identify model names vs. non-model names?
+
+First, analyze the abstract to identify which model names are actually mentioned.
+Then compare the prediction to the gold labels.
+
+Give a score between 0.0 (completely wrong) and 1.0 (perfect match), with partial credit for partial matches.
+Explain your scoring with specific details about what was correct and incorrect in the prediction.
+
+Your response should be in the format:
+{eval_delimiter}
+Score: [score between 0.0 and 1.0]
+Explanation: [detailed explanation]
+{eval_delimiter_end}
+"""
+
+# Routes judge requests sharing JUDGE_PREFIX to the same cache server
+JUDGE_PROMPT_CACHE_KEY = "judge_v1"
+JUDGE_MODEL = "o3-mini"
+
+# Explanation recorded when the judge's response can't be parsed; such results are
+# neither cached nor logged, so they are retried on the next run
+PARSE_ERROR_EXPLANATION = "Error parsing evaluation"
+
+# Early stopping: stop after this many iterations whose score falls more than
+# EARLY_STOP_MIN_DELTA below the best score so far
+EARLY_STOP_PATIENCE = 1
+EARLY_STOP_MIN_DELTA = 0.01
+
+# Concurrency cap for parallel API calls, derived from the account's requests-per-minute limit
+RPM_LIMIT = 3000
+MAX_CONCURRENCY = min(48, max(1, RPM_LIMIT // 60))
+
+# Model used to generate predictions
+PREDICTION_MODEL = "gpt-4o-mini"
+
+# On-disk caches so repeated iterations only pay for calls whose inputs changed
+prediction_cache = diskcache.Cache(".pred_cache")
+evaluation_cache = diskcache.Cache(".eval_cache")
+
+# Metaprompt size limits: how many worst/best evaluations to show the improver,
+# how much of each abstract to keep, and the overall token budget
+METAPROMPT_WORST_EXAMPLES = 8
+METAPROMPT_BEST_EXAMPLES = 4
+METAPROMPT_ABSTRACT_CHARS = 500
+METAPROMPT_TOKEN_BUDGET = 8000
+
+# Number of abstracts packed into one prediction request.
+# Latency grows sublinearly with the batch size, so throughput improves until the
+# model starts dropping or mixing up entries; re-tune over {1, 4, 8, 16} when changing models.
+PREDICTION_BATCH_SIZE = 8
+
 # Using zero-shot approach (no examples)
 
 # Initial system prompt
@@ -48,37 +114,49 @@ INITIAL_SYSTEM_PROMPT = """Your task is to extract model names from machine lear
 <instructions>
 """
 
+# Leads the user message when several abstracts share one request
+BATCH_INSTRUCTIONS = """Each abstract below is prefixed with its number in double brackets, e.g. [[1]].
+Return one prediction for every abstract, with abstract_id set to that number and tags set to the array for that abstract."""
+
+class TagPrediction(BaseModel):
+    """Model names extracted from one abstract in a batch"""
+    abstract_id: int
+    tags: List[str]
+
+class TagPredictions(BaseModel):
+    """Structured response for a batch of abstracts"""
+    predictions: List[TagPrediction]
+
+def parse_gold_labels(labels_str: str) -> List[str]:
+    """
+    Convert a string representation of a list of labels into a clean list
+    """
+    try:
+        # Use ast.literal_eval to safely convert string representation of list to actual list
+        return [item.strip() for item in ast.literal_eval(labels_str)]
+    except (ValueError, SyntaxError):
+        # If parsing fails, return empty list
+        print(f"Warning: Could not parse gold_labels: {labels_str}")
+        return []
+
 def load_validation_data(filepath: str) -> pd.DataFrame:
     """
     Load the validation dataset from a JSON file
     """
     print(f"Loading validation data from {filepath}...")
-    with open(filepath, 'r') as f:
-        data = json.load(f)
+    with open(filepath, 'rb') as f:
+        data = orjson.loads(f.read())
     # Convert to DataFrame for compatibility
     df = pd.DataFrame(data)
     
-    # Process gold_labels - they are stored as strings that look like arrays
-    def process_gold_labels(labels_str):
-        if isinstance(labels_str, str):
-            try:
-                # Use ast.literal_eval to safely convert string representation of list to actual list
-                labels_list = ast.literal_eval(labels_str)
-                # Clean up white spaces from items in the list
-                return [item.strip() for item in labels_list]
-            except (ValueError, SyntaxError):
-                # If parsing fails, return empty list
-                print(f"Warning: Could not parse gold_labels: {labels_str}")
-                return []
-        elif isinstance(labels_str, list):
-            # If it's already a list, just clean it up
-            return [item.strip() for item in labels_str]
-        else:
-            # Unknown type
-            print(f"Warning: Unknown gold_labels type: {type(labels_str)}, value: {labels_str}")
-            return []
-    
-    df['gold_labels'] = df['gold_labels'].apply(process_gold_labels)
+    # Process gold_labels - the field type is the same for every record, so check it once
+    # and process the whole column with a list comprehension
+    if data and isinstance(data[0]["gold_labels"], str):
+        # Stored as Python-style list literals (single quotes), which JSON parsers reject
+        df['gold_labels'] = [parse_gold_labels(labels) for labels in df['gold_labels']]
+    else:
+        # Already lists, just clean up white spaces from items in the list
+        df['gold_labels'] = [[item.strip() for item in labels] for labels in df['gold_labels']]
     return df
 
 def construct_prompt(system_prompt: str) -> List[Dict[str, Any]]:
@@ -94,108 +172,133 @@ def construct_prompt(system_prompt: str) -> List[Dict[str, Any]]:
     
     return messages
 
-def generate_predictions(val_data: pd.DataFrame, messages: List[Dict[str, Any]]) -> List[Tuple[str, str, List[str]]]:
+def format_abstract_batch(abstracts: List[str]) -> str:
+    """
+    Pack several abstracts into one user message, each tagged with its position
+    """
+    entries = "\n".join(f"[[{i}]] {abstract}" for i, abstract in enumerate(abstracts, 1))
+    return f"{BATCH_INSTRUCTIONS}\n\n{entries}"
+
+def collect_batch_predictions(parsed: Optional[TagPredictions], batch_size: int) -> List[Optional[List[str]]]:
+    """
+    Split a batched structured response back into one prediction list per abstract
+    Abstracts the model skipped (or a refused batch) come back as None
+    """
+    predictions = {}
+    if parsed:
+        predictions = {prediction.abstract_id: prediction.tags for prediction in parsed.predictions}
+    
+    return [predictions.get(i) for i in range(1, batch_size + 1)]
+
+def content_key(*parts: str) -> str:
+    """
+    Stable key for a tuple of strings, used for the disk caches and for deduplication
+    blake2b is faster than sha256 and 128 bits is plenty for exact-match keys
+    """
+    return hashlib.blake2b("\x1f".join(parts).encode(), digest_size=16).hexdigest()
+
+async def generate_predictions(val_data: pd.DataFrame, messages: List[Dict[str, Any]], iteration: int = 0, batch_size: int = PREDICTION_BATCH_SIZE) -> List[Tuple[str, str, List[str]]]:
     """
     Generate predictions for paper abstracts using GPT-4o
+    Abstracts already predicted under the same prompt are served from the disk cache.
+    The rest are sent batch_size at a time so the system prompt is billed once per batch,
+    and batches are issued concurrently, capped at MAX_CONCURRENCY in flight
     """
     print("Generating predictions...")
-    results = []
-    
-    for _, row in val_data.iterrows():
-        paper = row["paper"]
-        abstract = row["abstract"]
-        # Gold labels are already lists from JSON, just ensure they're clean
-        gold_labels = row["gold_labels"]
-        
-        # Create copy of messages to modify for this specific example
-        query_messages = messages.copy()
-        
-        # Add the current abstract as a user query
-        query_messages.append({
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+    rows = list(val_data.itertuples())
+    
+    # Shared by every request in this iteration, so after the first call
+    # OpenAI's automatic prefix cache can serve the system prompt
+    system_messages = tuple(messages)
+    prompt_cache_key = f"tag_iter_{iteration}"
+    
+    # Predictions only depend on the prompt and the abstract
+    prompt_id = orjson.dumps(messages, option=orjson.OPT_SORT_KEYS).decode()
+    keys = [content_key(PREDICTION_MODEL, prompt_id, row.abstract) for row in rows]
+    pred_lists = {key: prediction_cache[key] for key in keys if key in prediction_cache}
+    # Duplicate abstracts share a key, so each one is only sent once
+    misses = list({key: row for key, row in zip(keys, rows) if key not in pred_lists}.items())
+    
+    async def predict_batch(batch):
+        # Add the current abstracts as a single user query after the shared prefix
+        user_turn = {
             "role": "user",
             "content": [
                 {
                     "type": "text", 
-                    "text": f"Abstract: {abstract}"
+                    "text": format_abstract_batch([row.abstract for _, row in batch])
                 }
             ]
-        })
+        }
+        query_messages = system_messages + (user_turn,)
         
-        # Get model prediction
-        prediction = get_chat_completion(query_messages, model="gpt-4o-mini", temperature=0)
+        # Get model predictions
+        async with sem:
+            parsed = await aget_parsed_completion(
+                query_messages, TagPredictions, model=PREDICTION_MODEL, temperature=0, prompt_cache_key=prompt_cache_key
+            )
         
-        # Extract just the array from the prediction if it includes "Tags: "
-        if "Tags: " in prediction:
-            prediction = prediction.replace("Tags: ", "")
-            
-        # Parse prediction into an actual list
-        try:
-            pred_list = ast.literal_eval(prediction)
-        except (SyntaxError, ValueError):
-            # If the model doesn't return a valid list, try to extract it
-            import re
-            match = re.search(r'\[(.*?)\]', prediction)
-            if match:
-                pred_string = match.group(0)
-                try:
-                    pred_list = ast.literal_eval(pred_string)
-                except:
-                    pred_list = ["NA"]  # Fallback if everything fails
-            else:
-                pred_list = ["NA"]
-                
-        results.append((paper, abstract, gold_labels, pred_list))
-    
-    print(f"Generated predictions for {len(results)} papers")
+        # Only cache what the model actually answered, so skipped abstracts are retried next run
+        for (key, _), pred_list in zip(batch, collect_batch_predictions(parsed, len(batch))):
+            if pred_list is not None:
+                prediction_cache[key] = pred_list
+                pred_lists[key] = pred_list
+    
+    batches = [misses[i:i + batch_size] for i in range(0, len(misses), batch_size)]
+    await asyncio.gather(*[predict_batch(batch) for batch in batches])
+    
+    # Gold labels are already lists from JSON, just ensure they're clean
+    results = [
+        (row.paper, row.abstract, row.gold_labels, pred_lists.get(key, ["NA"]))
+        for key, row in zip(keys, rows)
+    ]
+    
+    print(f"Generated predictions for {len(results)} papers in {len(batches)} requests ({len(misses)} unique uncached abstracts)")
     return results
 
-def evaluate_prediction(abstract: str, 
-                       prediction: List[str], 
-                       gold_labels: List[str], 
-                       model: str = "o3-mini") -> Tuple[float, str]:
+def build_judge_prompt(abstract: str, prediction: List[str], gold_labels: List[str]) -> str:
+    """
+    Build the judge prompt for one evaluated triple
+    """
+    # Static instructions first, sample-specific data last, so the prefix is cacheable
+    return JUDGE_PREFIX + f"""
+{abstract_delimiter}
+{abstract}
+{abstract_delimiter_end}
+
+{prediction_delimiter}
+{prediction}
+{prediction_delimiter_end}
+
+{gold_delimiter}
+{gold_labels}
+{gold_delimiter_end}
+"""
+
+async def evaluate_prediction(abstract: str, 
+                             prediction: List[str], 
+                             gold_labels: List[str], 
+                             model: str = JUDGE_MODEL) -> Tuple[float, str]:
     """
     Evaluate a single prediction using o3-mini as the judge
     Returns the score and explanation
     """
-    judge_prompt = f"""
-    {abstract_delimiter}
-    {abstract}
-    {abstract_delimiter_end}
-    
-    {prediction_delimiter}
-    {prediction}
-    {prediction_delimiter_end}
+    judge_prompt = build_judge_prompt(abstract, prediction, gold_labels)
     
-    {gold_delimiter}
-    {gold_labels}
-    {gold_delimiter_end}
-    
-    Your task is to evaluate how well the prediction matches the gold labels for extracting model names from a machine learning paper abstract.
-    
-    Evaluation criteria:
-    1. Precision: Are all predicted model names actually present in the abstract and are they actual model names? 
-    2. Recall: Did the prediction capture all model names in the abstract?
-    3. Accuracy: Did the prediction correctly identify model names vs. non-model names?
-    
-    First, analyze the abstract to identify which model names are actually mentioned.
-    Then compare the prediction to the gold labels.
-    
-    Give a score between 0.0 (completely wrong) and 1.0 (perfect match), with partial credit for partial matches.
-    Explain your scoring with specific details about what was correct and incorrect in the prediction.
-    
-    Your response should be in the format:
-    {eval_delimiter}
-    Score: [score between 0.0 and 1.0]
-    Explanation: [detailed explanation]
-    {eval_delimiter_end}
-    """
+    # Judge verdicts only depend on the judge model and the prompt built from the evaluated triple
+    key = content_key(model, judge_prompt)
+    if key in evaluation_cache:
+        return evaluation_cache[key]
     
     # Get evaluation from o3-mini
     messages = [
         {"role": "user", "content": judge_prompt}
     ]
     
-    response = get_reasoning_response(messages, model=model, reasoning_effort="low")
+    response = await aget_reasoning_response(
+        messages, model=model, reasoning_effort="low", prompt_cache_key=JUDGE_PROMPT_CACHE_KEY
+    )
     
     # Extract score and explanation from response
     try:
@@ -207,64 +310,157 @@ def evaluate_prediction(abstract: str,
         # Clean up explanation if it starts with "Explanation:"
         if explanation.startswith('Explanation:'):
             explanation = explanation.replace('Explanation:', '').strip()
+        
+        evaluation_cache[key] = (score, explanation)
             
     except (IndexError, ValueError) as e:
         print(f"Error parsing evaluation: {e}")
         print(f"Raw response: {response}")
         score = 0.0
-        explanation = "Error parsing evaluation"
+        explanation = PARSE_ERROR_EXPLANATION
         
     return score, explanation
 
-def evaluate_predictions(predictions: List[Tuple[str, str, List[str], List[str]]]) -> List[Dict[str, Any]]:
+def evaluation_log_path(output_dir: str, iteration: int) -> str:
+    """
+    Path of the JSONL file evaluation results are streamed to during an iteration
+    """
+    return f"{output_dir}/eval_iter_{iteration}.jsonl"
+
+def evaluation_key(abstract: str, prediction: List[str], gold_labels: List[str], model: str = JUDGE_MODEL) -> str:
+    """
+    Identify one evaluation by the judge model and prompt, the same key evaluation_cache uses,
+    so a changed judge never reuses old verdicts
+    """
+    return content_key(model, build_judge_prompt(abstract, prediction, gold_labels))
+
+def load_evaluation_log(log_path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Load results already written by an interrupted run, keyed by the evaluation_key
+    they were logged under
+    """
+    completed = {}
+    if not os.path.exists(log_path):
+        return completed
+    
+    with open(log_path, "rb") as f:
+        for line in f:
+            try:
+                result = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                # The last line may be cut short if the run crashed mid-write
+                continue
+            key = result.pop("key", None)
+            if key is not None:
+                completed[key] = result
+    
+    return completed
+
+async def evaluate_predictions(predictions: List[Tuple[str, str, List[str], List[str]]], iteration: int = 0, output_dir: str = "results") -> List[Dict[str, Any]]:
     """
     Evaluate all predictions using LLM-as-a-judge with o3-mini
+    Judge calls are issued concurrently, capped at MAX_CONCURRENCY in flight.
+    Each result is appended to a JSONL log as soon as it arrives, so a crashed run
+    resumes by skipping the rows already in the log. Unparseable verdicts are left out
+    of the log so they are judged again. Duplicate rows are judged once.
     """
     print("Evaluating predictions with o3-mini...")
-    evaluation_results = []
-    
-    for i, (paper, abstract, gold_labels, pred_list) in enumerate(predictions):
-        print(f"Evaluating paper {i+1}/{len(predictions)}: {paper}")
-        score, explanation = evaluate_prediction(abstract, pred_list, gold_labels)
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+    os.makedirs(output_dir, exist_ok=True)
+    log_path = evaluation_log_path(output_dir, iteration)
+    completed = load_evaluation_log(log_path)
+    if completed:
+        print(f"Resuming: {len(completed)} evaluations already in {log_path}")
+    
+    # Identical (abstract, prediction, gold labels) triples only need to be judged once
+    keys = [evaluation_key(abstract, pred_list, gold_labels) for _, abstract, gold_labels, pred_list in predictions]
+    unique = {}
+    for key, prediction in zip(keys, predictions):
+        unique.setdefault(key, prediction)
+    
+    async def evaluate_one(i, key, paper, abstract, gold_labels, pred_list):
+        if key in completed:
+            return completed[key]
+        
+        async with sem:
+            score, explanation = await evaluate_prediction(abstract, pred_list, gold_labels)
+        print(f"Evaluated paper {i+1}/{len(unique)}: {paper}")
         print(f"Score: {score:.4f}, gold labels: {gold_labels}, prediction: {pred_list}")
 
-        evaluation_results.append({
+        result = {
             "paper": paper,
             "abstract": abstract,
             "gold_labels": gold_labels,
             "prediction": pred_list,
             "score": score,
             "explanation": explanation
-        })
+        }
+        if explanation != PARSE_ERROR_EXPLANATION:
+            # The key is stored rather than recomputed on load, so entries written under
+            # a different judge model or prompt are never matched
+            log_file.write(orjson.dumps({"key": key, **result}) + b"\n")
+            log_file.flush()
+        return result
+    
+    with open(log_path, "ab") as log_file:
+        unique_results = await asyncio.gather(
+            *[evaluate_one(i, key, *prediction) for i, (key, prediction) in enumerate(unique.items())]
+        )
+    scored = dict(zip(unique, unique_results))
+    
+    # Broadcast verdicts back to every row, keeping each row's own paper title
+    evaluation_results = [{**scored[key], "paper": prediction[0]} for key, prediction in zip(keys, predictions)]
+    avg_score = mean(result["score"] for result in evaluation_results) if evaluation_results else 0.0
     
-    # Calculate average score
-    avg_score = mean([result["score"] for result in evaluation_results])
     print(f"Evaluation complete. Average score: {avg_score:.4f}")
     
     return evaluation_results, avg_score
 
+def select_metaprompt_examples(evaluations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Pick the worst- and best-scoring evaluations, the most informative ones for the improver
+    """
+    ranked = sorted(evaluations, key=lambda e: e["score"])
+    if len(ranked) <= METAPROMPT_WORST_EXAMPLES + METAPROMPT_BEST_EXAMPLES:
+        return ranked
+    
+    return ranked[:METAPROMPT_WORST_EXAMPLES] + ranked[-METAPROMPT_BEST_EXAMPLES:]
+
+@functools.cache
+def metaprompt_encoding():
+    """
+    Tokenizer for the metaprompt budget, loaded on first use since tiktoken
+    may need to download it
+    """
+    try:
+        return tiktoken.encoding_for_model("o3-mini")
+    except KeyError:
+        # Older tiktoken releases don't know o3-mini; it shares the o200k tokenizer
+        return tiktoken.get_encoding("o200k_base")
+
 def generate_metaprompt(system_prompt: str, evaluations: List[Dict[str, Any]]) -> str:
     """
     Generate a metaprompt for improving the system prompt based on evaluation results
     """
     print("Generating metaprompt for prompt improvement...")
     
-    # Use all evaluations to provide complete context to the model
-    # This gives the model more information to make better improvements
+    # Sending every evaluation makes the metaprompt grow with the dataset,
+    # so only a score-stratified sample with trimmed abstracts is included
+    chosen = select_metaprompt_examples(evaluations)
     
-    eval_examples = ""
-    for eval_data in evaluations:
-        eval_examples += f"""
-Paper: {eval_data['paper']}
-Abstract: {eval_data['abstract']}
+    while True:
+        eval_examples = ""
+        for eval_data in chosen:
+            eval_examples += f"""
+Abstract: {eval_data['abstract'][:METAPROMPT_ABSTRACT_CHARS]}
 Gold Labels: {eval_data['gold_labels']}
 Prediction: {eval_data['prediction']}
 Score: {eval_data['score']}
 Explanation: {eval_data['explanation']}
 
 """
-    
-    metaprompt = f"""
+        
+        metaprompt = f"""
 You are an expert prompt engineer tasked with improving a system prompt for extracting model names from machine learning paper abstracts.
 
 Here is the current prompt to improve:
@@ -281,10 +477,17 @@ Based on these evaluations and its details like explanation and scores, please m
 Don't change the instructions outside of <instructions><instructions>, keep those the same.
 Output only the improved system prompt.
 """
+        
+        num_tokens = len(metaprompt_encoding().encode(metaprompt))
+        if num_tokens <= METAPROMPT_TOKEN_BUDGET or len(chosen) <= 1:
+            break
+        # Over budget: drop the best-scoring example first, failures carry more signal
+        chosen = chosen[:-1]
     
+    print(f"Metaprompt uses {len(chosen)} of {len(evaluations)} evaluations ({num_tokens} tokens)")
     return metaprompt
 
-def improve_prompt(system_prompt: str, evaluations: List[Dict[str, Any]]) -> str:
+async def improve_prompt(system_prompt: str, evaluations: List[Dict[str, Any]]) -> str:
     """
     Generate an improved system prompt based on evaluation results using metaprompting
     """
@@ -296,7 +499,7 @@ def improve_prompt(system_prompt: str, evaluations: List[Dict[str, Any]]) -> str
     ]
     
     print("Getting improved prompt from o3-mini...")
-    improved_prompt = get_reasoning_response(messages, model="o3-mini", reasoning_effort="high")
+    improved_prompt = await aget_reasoning_response(messages, model="o3-mini", reasoning_effort="high")
     
     return improved_prompt
 
@@ -311,8 +514,8 @@ def save_results(iteration: int, system_prompt: str, evaluations: List[Dict[str,
         f.write(system_prompt)
     
     # Save evaluations
-    with open(f"{output_dir}/evaluations_iteration_{iteration}.json", "w") as f:
-        json.dump(evaluations, f, indent=2)
+    with open(f"{output_dir}/evaluations_iteration_{iteration}.json", "wb") as f:
+        f.write(orjson.dumps(evaluations, option=orjson.OPT_INDENT_2))
     
     # Save summary
     with open(f"{output_dir}/summary_iteration_{iteration}.txt", "w") as f:
@@ -346,7 +549,36 @@ def save_final_results(best_iteration: int, best_prompt: str, best_score: float,
         f.write("\nBest System Prompt:\n")
         f.write(best_prompt)
 
-def main():
+def save_checkpoint(checkpoint_path: str, state: Dict[str, Any]):
+    """
+    Persist the iteration state so an interrupted run can resume where it left off
+    """
+    # Write to a temporary file first so a crash never leaves a half-written checkpoint
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(state, f)
+    os.replace(tmp_path, checkpoint_path)
+
+def load_checkpoint(checkpoint_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Load the iteration state saved by a previous run, if any
+    """
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, "rb") as f:
+        return pickle.load(f)
+
+def clear_checkpoint(checkpoint_path: str, output_dir: str):
+    """
+    Remove the checkpoint and the evaluation resume logs once a run has finished,
+    so the next run starts fresh
+    """
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    for log_path in glob.glob(f"{output_dir}/eval_iter_*.jsonl"):
+        os.remove(log_path)
+
+async def main():
     # Load validation data
     val_data = load_validation_data("../../data/val_data.json")
 
@@ -358,25 +590,47 @@ def main():
     # Create output directory
     os.makedirs(output_dir, exist_ok=True)
     
-    # Iteration tracking
-    best_score = 0.0
-    best_prompt = system_prompt
-    best_iteration = 0
-    scores_history = []
+    # Iteration tracking, restored from the checkpoint if a previous run was interrupted
+    checkpoint_path = f"{output_dir}/checkpoint.pkl"
+    state = load_checkpoint(checkpoint_path)
+    if state:
+        print(f"Resuming from checkpoint at iteration {state['next_iteration']}")
+        system_prompt = state["system_prompt"]
+    else:
+        state = {
+            "next_iteration": 0,
+            "system_prompt": system_prompt,
+            "best_score": 0.0,
+            "best_prompt": system_prompt,
+            "best_iteration": 0,
+            "scores_history": [],
+            "bad_streak": 0,
+        }
+    best_score = state["best_score"]
+    best_prompt = state["best_prompt"]
+    best_iteration = state["best_iteration"]
+    scores_history = state["scores_history"]
+    bad_streak = state["bad_streak"]
     
     print("Starting LLM-as-a-judge with metaprompting process...")
     
-    for iteration in range(max_iterations):
+    # A run that stopped early but died before clearing its checkpoint only needs its final results written
+    start_iteration = state["next_iteration"]
+    if bad_streak >= EARLY_STOP_PATIENCE:
+        print("Previous run already stopped early; writing its final results")
+        start_iteration = max_iterations
+    
+    for iteration in range(start_iteration, max_iterations):
         print(f"\n==== Iteration {iteration} ====")
         
         # Construct zero-shot prompt
         messages = construct_prompt(system_prompt)
         
         # Generate predictions
-        predictions = generate_predictions(val_data, messages)
+        predictions = await generate_predictions(val_data, messages, iteration)
         
         # Evaluate predictions
-        evaluations, avg_score = evaluate_predictions(predictions)
+        evaluations, avg_score = await evaluate_predictions(predictions, iteration, output_dir)
         scores_history.append(avg_score)
         
         # Save results for this iteration
@@ -387,23 +641,45 @@ def main():
             best_score = avg_score
             best_prompt = system_prompt
             best_iteration = iteration
+            bad_streak = 0
             print(f"New best score: {best_score:.4f} at iteration {best_iteration}")
         else:
             print(f"Score did not improve. Current: {avg_score:.4f}, Best: {best_score:.4f}")
-            # Continue with the next iteration regardless of score improvement
+            if avg_score < best_score - EARLY_STOP_MIN_DELTA:
+                bad_streak += 1
+        
+        # Stop once results regress, instead of paying for more full passes
+        stop_early = bad_streak >= EARLY_STOP_PATIENCE
         
         # Improve prompt using metaprompting (if not the last iteration)
-        if iteration < max_iterations - 1:
-            system_prompt = improve_prompt(system_prompt, evaluations)
+        if iteration < max_iterations - 1 and not stop_early:
+            system_prompt = await improve_prompt(system_prompt, evaluations)
             print(f"Updated system prompt for next iteration:\n{system_prompt}")
+        
+        save_checkpoint(checkpoint_path, {
+            "next_iteration": iteration + 1,
+            "system_prompt": system_prompt,
+            "best_score": best_score,
+            "best_prompt": best_prompt,
+            "best_iteration": best_iteration,
+            "scores_history": scores_history,
+            "bad_streak": bad_streak,
+        })
+        
+        if stop_early:
+            print(f"Stopping early: score regressed for {bad_streak} iteration(s)")
+            break
     
     # Save final results
     save_final_results(best_iteration, best_prompt, best_score, scores_history, output_dir)
     
+    # The run is complete (or stopped early), so there is nothing left to resume
+    clear_checkpoint(checkpoint_path, output_dir)
+    
     print(f"\n==== Process Complete ====")
     print(f"Best score: {best_score:.4f} at iteration {best_iteration}")
     print(f"Final results saved to {output_dir}")
     print(f"Best system prompt saved to {output_dir}/best_system_prompt.txt")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -2,7 +2,10 @@ import warnings
 warnings.filterwarnings("ignore")
 import sys
 import os
-import json
+import re
+import orjson
+import asyncio
+import numpy as np
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from utils import * 
@@ -62,9 +65,142 @@ class NutritionInfo(BaseModel):
 class QueryClassification(BaseModel):
     query_type: str  # RECIPE, RESTAURANT, NUTRITION, or OTHER
 
-def analyze_query(user_query):
-    """Analyze the query to determine its intent using structured outputs"""
-    system_message = """
+class NumberedQueryClassification(BaseModel):
+    query_id: int  # the query's number in the batched list
+    query_type: str  # RECIPE, RESTAURANT, NUTRITION, or OTHER
+
+class QueryClassificationBatch(BaseModel):
+    classifications: List[NumberedQueryClassification]  # one per query
+
+# JSON schemas for the documented models, built once at import since schema
+# generation is one of pydantic's most expensive operations
+_DOCUMENTED_MODELS = (Recipe, Restaurant, NutritionInfo, QueryClassification)
+
+_SCHEMA_CACHE = {
+    model.__name__: orjson.dumps(model.model_json_schema(), option=orjson.OPT_INDENT_2).decode()
+    for model in _DOCUMENTED_MODELS
+}
+
+# Example values for the documented models
+_EXAMPLE_VALUES = {
+    "Recipe": {
+        "name": "Example name",
+        "cuisine": "Example cuisine",
+        "prep_time_minutes": 30,
+        "cook_time_minutes": 30,
+        "serving_size": 4,
+        "ingredients": [{"name": "Flour", "quantity": "2 cups", "substitutes": ["Almond flour", "Coconut flour"]}],
+        "instructions": ["Step 1: Mix ingredients", "Step 2: Bake for 20 minutes"],
+        "dietary_info": ["Vegetarian", "Gluten-free"],
+    },
+    "Restaurant": {
+        "name": "Example name",
+        "cuisine": "Example cuisine",
+        "price_range": "$$$",
+        "location": "New York, NY",
+        "rating": 4.5,
+        "popular_dishes": ["Signature Pasta", "Chocolate Cake"],
+        "dietary_options": ["Vegetarian", "Vegan options"],
+    },
+    "NutritionInfo": {
+        "food_name": "Example food_name",
+        "serving_size": "100g",
+        "calories": 250,
+        "protein_grams": 10.5,
+        "carbs_grams": 10.5,
+        "fat_grams": 10.5,
+        "fiber_grams": 10.5,
+        "vitamins": ["Vitamin A", "Vitamin C"],
+        "minerals": ["Calcium", "Iron"],
+    },
+    "QueryClassification": {
+        "query_type": "RECIPE",
+    },
+}
+
+# Examples follow each model's field order from model_fields, so a field added
+# to a model without an example value fails at import instead of going undocumented
+_EXAMPLES = {
+    model.__name__: {field: _EXAMPLE_VALUES[model.__name__][field] for field in model.model_fields}
+    for model in _DOCUMENTED_MODELS
+}
+
+# Local rules for obvious query types, checked before the semantic cache and the LLM.
+# A query is only labelled when exactly one pattern matches; anything ambiguous falls through.
+_RECIPE_RE = re.compile(r"\b(recipes?|how (do|to|can) (i |you )?(cook|make|bake|prepare)|ingredients for)\b", re.I)
+_RESTAURANT_RE = re.compile(r"\b(restaurants?|places? to eat|where (can|should) i eat|(eat|dine|dinner|lunch|brunch) near me)\b", re.I)
+_NUTRITION_RE = re.compile(r"\b(calories|nutrition(al)?|macros|how (much|many) (protein|carbs|fat|fiber|sugar)|(protein|carbs|fat|fiber|sugar) (in|content))\b", re.I)
+
+_FAST_RULES = (
+    ("RECIPE", _RECIPE_RE),
+    ("RESTAURANT", _RESTAURANT_RE),
+    ("NUTRITION", _NUTRITION_RE),
+)
+
+def _fast_classify(user_query):
+    """Return the query type if exactly one local rule matches, otherwise None"""
+    matches = [label for label, pattern in _FAST_RULES if pattern.search(user_query)]
+    return matches[0] if len(matches) == 1 else None
+
+# Picking one of four labels doesn't need the full model; generation stays on gpt-4o
+CLASSIFICATION_MODEL = "gpt-4o-mini"
+
+# Semantic cache for query classification: paraphrases of a query seen before reuse its
+# label, so one embedding call and a dot product replace an LLM call
+SEMANTIC_CACHE_DIR = ".query_cache"
+SEMANTIC_CACHE_THRESHOLD = 0.92  # minimum cosine similarity for a hit
+
+def load_semantic_cache():
+    """Load the persisted query embeddings (unit-normalized) and their labels"""
+    embeddings_path = os.path.join(SEMANTIC_CACHE_DIR, "embeddings.npy")
+    labels_path = os.path.join(SEMANTIC_CACHE_DIR, "labels.json")
+    if not (os.path.exists(embeddings_path) and os.path.exists(labels_path)):
+        return np.empty((0, 0), dtype=np.float32), []
+    
+    with open(labels_path, "rb") as f:
+        labels = orjson.loads(f.read())
+    embeddings = np.load(embeddings_path)
+    if embeddings.shape[0] != len(labels):
+        # The two files were written by different saves; start with an empty cache
+        return np.empty((0, 0), dtype=np.float32), []
+    return embeddings, labels
+
+def save_semantic_cache():
+    """Persist the query embeddings and labels for the next run"""
+    os.makedirs(SEMANTIC_CACHE_DIR, exist_ok=True)
+    np.save(os.path.join(SEMANTIC_CACHE_DIR, "embeddings.npy"), _query_embeddings)
+    with open(os.path.join(SEMANTIC_CACHE_DIR, "labels.json"), "wb") as f:
+        f.write(orjson.dumps(_query_labels))
+
+_query_embeddings, _query_labels = load_semantic_cache()
+
+async def embed_query(user_query):
+    """Embed a query as a unit vector, so a dot product gives cosine similarity"""
+    vector = np.asarray(await aget_embedding(user_query), dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+async def embed_queries(user_queries):
+    """Embed several queries as unit vectors in a single request"""
+    vectors = np.asarray(await aget_embeddings(user_queries), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def lookup_semantic_cache(vector):
+    """Return the label of the most similar cached query, or None below the threshold"""
+    if not _query_labels:
+        return None
+    
+    sims = _query_embeddings @ vector
+    best = int(sims.argmax())
+    return _query_labels[best] if sims[best] >= SEMANTIC_CACHE_THRESHOLD else None
+
+def add_to_semantic_cache(vector, label):
+    """Remember the label for a newly classified query"""
+    global _query_embeddings
+    _query_embeddings = vector[np.newaxis, :] if not _query_labels else np.vstack([_query_embeddings, vector])
+    _query_labels.append(label)
+
+# System prompts, built once at import rather than on every call
+QUERY_CLASSIFICATION_MESSAGE = """
     You are a food query analyzer. Classify the user's food-related query into one of these categories:
     - RECIPE: Request for a recipe or cooking instructions
     - RESTAURANT: Request for restaurant recommendations
@@ -74,17 +210,12 @@ def analyze_query(user_query):
     Provide your classification as the query_type field.
     """
 
-    result = get_structured_output(user_query, system_message, QueryClassification, "query classification")
-    
-    if result:
-        return result.query_type
-    else:
-        # Fallback to a safe default if structured output fails
-        return "OTHER"
+BATCH_CLASSIFICATION_MESSAGE = QUERY_CLASSIFICATION_MESSAGE + """
+    The user message contains a numbered list of queries. Return one classification per query,
+    with query_id set to that query's number.
+    """
 
-def get_structured_recipe(query):
-    """Get a structured recipe response for a recipe query"""
-    system_message = """
+RECIPE_MESSAGE = """
     You are a helpful cooking assistant. Provide a detailed recipe based on the user's request.
     
     Make sure to include all required fields:
@@ -98,11 +229,7 @@ def get_structured_recipe(query):
     - dietary_info: List of dietary information (e.g., "vegetarian", "gluten-free")
     """
 
-    return get_structured_output(query, system_message, Recipe, "recipe")
-
-def get_structured_restaurant_recommendations(query):
-    """Get structured restaurant recommendations"""
-    system_message = """
+RESTAURANT_MESSAGE = """
     You are a restaurant recommendation assistant. Provide restaurant suggestions based on the user's request.
     
     Make sure to include all required fields:
@@ -115,11 +242,7 @@ def get_structured_restaurant_recommendations(query):
     - dietary_options: List of available dietary options (e.g., "vegetarian", "vegan", "gluten-free")
     """
 
-    return get_structured_output(query, system_message, Restaurant, "restaurant recommendation")
-
-def get_structured_nutrition_info(query):
-    """Get structured nutritional information"""
-    system_message = """
+NUTRITION_MESSAGE = """
     You are a nutrition information assistant. Provide detailed nutritional data for the food item requested.
     
     Make sure to include all required fields:
@@ -134,54 +257,151 @@ def get_structured_nutrition_info(query):
     - minerals: List of minerals present in significant amounts
     """
 
-    return get_structured_output(query, system_message, NutritionInfo, "nutrition information")
-
-def get_unstructured_response(query):
-    """Get a regular unstructured response for other food-related queries"""
-    system_message = """
+GENERAL_MESSAGE = """
     You are a helpful food assistant. Answer the user's food-related query with useful information.
     """
 
+async def analyze_query(user_query):
+    """Analyze the query to determine its intent using structured outputs"""
+    # Obvious cases are settled locally without any API call
+    fast_label = _fast_classify(user_query)
+    if fast_label:
+        return fast_label
+    
+    # Reuse the label of a near-identical query classified before.
+    # The cache is only an optimization, so an embedding failure counts as a miss
+    try:
+        vector = await embed_query(user_query)
+    except Exception as e:
+        print(f"Error embedding query for the semantic cache: {e}")
+        vector = None
+    cached_label = lookup_semantic_cache(vector) if vector is not None else None
+    if cached_label:
+        return cached_label
+
+    result = await aget_structured_output(user_query, QUERY_CLASSIFICATION_MESSAGE, QueryClassification, "query classification",
+                                          model=CLASSIFICATION_MODEL)
+    
+    if result:
+        if vector is not None:
+            add_to_semantic_cache(vector, result.query_type)
+        return result.query_type
+    else:
+        # Fallback to a safe default if structured output fails
+        return "OTHER"
+
+async def analyze_queries_batch(queries):
+    """Classify several queries with at most one embedding request and one LLM call"""
+    query_types = [_fast_classify(query) for query in queries]
+    
+    # Only embed the queries the local rules couldn't settle
+    pending = [i for i, query_type in enumerate(query_types) if query_type is None]
+    if not pending:
+        return query_types
+    
+    # An embedding failure only means the semantic cache is skipped
+    try:
+        vectors = dict(zip(pending, await embed_queries([queries[i] for i in pending])))
+    except Exception as e:
+        print(f"Error embedding queries for the semantic cache: {e}")
+        vectors = {}
+    for i in vectors:
+        query_types[i] = lookup_semantic_cache(vectors[i])
+    
+    # Only send the queries the semantic cache couldn't answer
+    misses = [i for i in pending if query_types[i] is None]
+    if not misses:
+        return query_types
+    
+    numbered = "\n".join(f"{n}. {queries[i]}" for n, i in enumerate(misses, 1))
+    result = await aget_structured_output(numbered, BATCH_CLASSIFICATION_MESSAGE, QueryClassificationBatch, "batch query classification",
+                                          model=CLASSIFICATION_MODEL)
+    # Match classifications to queries by number, so a skipped entry can't shift the rest
+    classifications = {c.query_id: c.query_type for c in result.classifications} if result else {}
+    
+    for n, i in enumerate(misses, 1):
+        if n in classifications:
+            query_types[i] = classifications[n]
+            if i in vectors:
+                add_to_semantic_cache(vectors[i], query_types[i])
+        else:
+            # Fallback to a safe default if the model skipped this query
+            query_types[i] = "OTHER"
+    
+    return query_types
+
+async def get_structured_recipe(query):
+    """Get a structured recipe response for a recipe query"""
+    return await aget_structured_output(query, RECIPE_MESSAGE, Recipe, "recipe")
+
+async def get_structured_restaurant_recommendations(query):
+    """Get structured restaurant recommendations"""
+    return await aget_structured_output(query, RESTAURANT_MESSAGE, Restaurant, "restaurant recommendation")
+
+async def get_structured_nutrition_info(query):
+    """Get structured nutritional information"""
+    return await aget_structured_output(query, NUTRITION_MESSAGE, NutritionInfo, "nutrition information")
+
+async def get_unstructured_response(query, on_delta=None):
+    """Get a regular unstructured response for other food-related queries
+    The answer is streamed; pass on_delta to receive each piece of text as it arrives,
+    e.g. to print it when only one response is being displayed at a time
+    """
     messages = [
-        {"role": "system", "content": system_message},
+        {"role": "system", "content": GENERAL_MESSAGE},
         {"role": "user", "content": query}
     ]
 
     try:
-        response = client.chat.completions.create(
+        # Stream the answer so text shows up at time-to-first-token
+        stream = await async_client.chat.completions.create(
             model="gpt-4o",
-            messages=messages
+            messages=messages,
+            stream=True
         )
         
-        return response.choices[0].message.content
+        parts = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            parts.append(delta)
+            if on_delta:
+                on_delta(delta)
+        
+        return "".join(parts)
     except Exception as e:
         print(f"Error with unstructured response: {e}")
         return "Sorry, I couldn't process your request at this time."
 
-def process_food_query(user_query):
-    """Main function to process food-related queries with structured outputs"""
+async def process_food_query(user_query, query_type=None, on_delta=None):
+    """Main function to process food-related queries with structured outputs
+    Pass query_type when the query was already classified, e.g. by analyze_queries_batch,
+    and on_delta to receive unstructured answers as they stream in
+    """
     print(f"Processing query: '{user_query}'")
     
     # Analyze the query intent
-    query_type = analyze_query(user_query)
+    if query_type is None:
+        query_type = await analyze_query(user_query)
     print(f"Query classified as: {query_type}")
     
     # Get appropriate structured response based on intent
     if query_type == "RECIPE":
-        response = get_structured_recipe(user_query)
+        response = await get_structured_recipe(user_query)
         # Example of how you might use the structured data
         if response:
             print("\n✓ Received structured recipe data")
             return format_recipe_display(response)
         
     elif query_type == "RESTAURANT":
-        response = get_structured_restaurant_recommendations(user_query)
+        response = await get_structured_restaurant_recommendations(user_query)
         if response:
             print("\n✓ Received structured restaurant data")
             return format_restaurant_display(response)
         
     elif query_type == "NUTRITION":
-        response = get_structured_nutrition_info(user_query)
+        response = await get_structured_nutrition_info(user_query)
         if response:
             print("\n✓ Received structured nutrition data")
             return format_nutrition_display(response)
@@ -189,70 +409,76 @@ def process_food_query(user_query):
     else:
         # For other queries, use unstructured response
         print("\n✓ Using unstructured response for general query")
-        return get_unstructured_response(user_query)
+        return await get_unstructured_response(user_query, on_delta)
     
     # Fallback if structured parsing failed
-    return get_unstructured_response(user_query)
+    return await get_unstructured_response(user_query, on_delta)
 
 # function to help display recipes
 def format_recipe_display(recipe):
     """Format the structured recipe data for display"""
-    display = f"# {recipe.name}\n\n"
-    display += f"**Cuisine:** {recipe.cuisine}\n"
-    display += f"**Prep Time:** {recipe.prep_time_minutes} minutes\n"
-    display += f"**Cook Time:** {recipe.cook_time_minutes} minutes\n"
-    display += f"**Servings:** {recipe.serving_size}\n\n"
-    
-    display += "## Ingredients\n\n"
-    for ingredient in recipe.ingredients:
-        display += f"- {ingredient.quantity} {ingredient.name}"
-        if ingredient.substitutes:
-            display += f" (Substitutes: {', '.join(ingredient.substitutes)})"
-        display += "\n"
+    parts = [
+        f"# {recipe.name}\n\n",
+        f"**Cuisine:** {recipe.cuisine}\n",
+        f"**Prep Time:** {recipe.prep_time_minutes} minutes\n",
+        f"**Cook Time:** {recipe.cook_time_minutes} minutes\n",
+        f"**Servings:** {recipe.serving_size}\n\n",
+        "## Ingredients\n\n",
+    ]
+    parts.extend(
+        f"- {ingredient.quantity} {ingredient.name}"
+        + (f" (Substitutes: {', '.join(ingredient.substitutes)})" if ingredient.substitutes else "")
+        + "\n"
+        for ingredient in recipe.ingredients
+    )
     
-    display += "\n## Instructions\n\n"
-    for i, step in enumerate(recipe.instructions, 1):
-        display += f"{i}. {step}\n"
+    parts.append("\n## Instructions\n\n")
+    parts.extend(f"{i}. {step}\n" for i, step in enumerate(recipe.instructions, 1))
     
-    display += f"\n**Dietary Information:** {', '.join(recipe.dietary_info)}\n"
+    parts.append(f"\n**Dietary Information:** {', '.join(recipe.dietary_info)}\n")
     
-    return display
+    return "".join(parts)
+
+# Star-rating strings for each whole rating from 0 to 5, indexed by rating
+_STARS = tuple("★" * i for i in range(6))
+_EMPTY = tuple(" ☆" * (5 - i) for i in range(6))
 
 # function to help display restaurants
 def format_restaurant_display(restaurant):
     """Format the structured restaurant data for display"""
-    display = f"# {restaurant.name}\n\n"
-    display += f"**Cuisine:** {restaurant.cuisine}\n"
-    display += f"**Price Range:** {restaurant.price_range}\n"
-    display += f"**Location:** {restaurant.location}\n"
-    display += f"**Rating:** {'★' * int(restaurant.rating)}{' ☆' * (5 - int(restaurant.rating))} ({restaurant.rating}/5)\n\n"
-    
-    display += "## Popular Dishes\n\n"
-    for dish in restaurant.popular_dishes:
-        display += f"- {dish}\n"
+    n = min(5, max(0, int(restaurant.rating)))
+    parts = [
+        f"# {restaurant.name}\n\n",
+        f"**Cuisine:** {restaurant.cuisine}\n",
+        f"**Price Range:** {restaurant.price_range}\n",
+        f"**Location:** {restaurant.location}\n",
+        f"**Rating:** {_STARS[n]}{_EMPTY[n]} ({restaurant.rating}/5)\n\n",
+        "## Popular Dishes\n\n",
+    ]
+    parts.extend(f"- {dish}\n" for dish in restaurant.popular_dishes)
     
-    display += f"\n**Dietary Options:** {', '.join(restaurant.dietary_options)}\n"
+    parts.append(f"\n**Dietary Options:** {', '.join(restaurant.dietary_options)}\n")
     
-    return display
+    return "".join(parts)
 
 # function to help display nutrition information
 def format_nutrition_display(nutrition):
     """Format the structured nutrition data for display"""
-    display = f"# Nutritional Information: {nutrition.food_name}\n\n"
-    display += f"**Serving Size:** {nutrition.serving_size}\n\n"
-    
-    display += "## Macronutrients\n\n"
-    display += f"- **Calories:** {nutrition.calories} kcal\n"
-    display += f"- **Protein:** {nutrition.protein_grams}g\n"
-    display += f"- **Carbohydrates:** {nutrition.carbs_grams}g\n"
-    display += f"- **Fat:** {nutrition.fat_grams}g\n"
-    display += f"- **Fiber:** {nutrition.fiber_grams}g\n\n"
-    
-    display += "## Micronutrients\n\n"
-    display += f"**Vitamins:** {', '.join(nutrition.vitamins)}\n"
-    display += f"**Minerals:** {', '.join(nutrition.minerals)}\n"
+    parts = [
+        f"# Nutritional Information: {nutrition.food_name}\n\n",
+        f"**Serving Size:** {nutrition.serving_size}\n\n",
+        "## Macronutrients\n\n",
+        f"- **Calories:** {nutrition.calories} kcal\n",
+        f"- **Protein:** {nutrition.protein_grams}g\n",
+        f"- **Carbohydrates:** {nutrition.carbs_grams}g\n",
+        f"- **Fat:** {nutrition.fat_grams}g\n",
+        f"- **Fiber:** {nutrition.fiber_grams}g\n\n",
+        "## Micronutrients\n\n",
+        f"**Vitamins:** {', '.join(nutrition.vitamins)}\n",
+        f"**Minerals:** {', '.join(nutrition.minerals)}\n",
+    ]
     
-    return display
+    return "".join(parts)
 
 # generate the json schemas
 def generate_json_schema_docs(pydantic_model):
@@ -265,48 +491,7 @@ def generate_json_schema_docs(pydantic_model):
         A tuple containing (model_name, schema_json, example_dict)
     """
     model_name = pydantic_model.__name__
-    schema_json = pydantic_model.schema_json(indent=2)
-    
-    # Create an example instance (this is a simplification and may not work for all models)
-    # In a real implementation, you would create specific examples for each model
-    example = {}
-    for field_name, field in pydantic_model.__annotations__.items():
-        if field_name == "ingredients" and model_name == "Recipe":
-            example[field_name] = [{"name": "Flour", "quantity": "2 cups", "substitutes": ["Almond flour", "Coconut flour"]}]
-        elif field_name == "popular_dishes" and model_name == "Restaurant":
-            example[field_name] = ["Signature Pasta", "Chocolate Cake"]
-        elif field_name == "vitamins" and model_name == "NutritionInfo":
-            example[field_name] = ["Vitamin A", "Vitamin C"]
-        elif field_name == "minerals" and model_name == "NutritionInfo":
-            example[field_name] = ["Calcium", "Iron"]
-        elif field_name == "instructions" and model_name == "Recipe":
-            example[field_name] = ["Step 1: Mix ingredients", "Step 2: Bake for 20 minutes"]
-        elif field_name == "dietary_info" and model_name == "Recipe":
-            example[field_name] = ["Vegetarian", "Gluten-free"]
-        elif field_name == "dietary_options" and model_name == "Restaurant":
-            example[field_name] = ["Vegetarian", "Vegan options"]
-        elif field_name == "query_type" and model_name == "QueryClassification":
-            example[field_name] = "RECIPE"
-        elif field_name in ["name", "cuisine", "food_name"]:
-            example[field_name] = f"Example {field_name}"
-        elif field_name == "price_range":
-            example[field_name] = "$$$"
-        elif field_name == "location":
-            example[field_name] = "New York, NY"
-        elif field_name == "rating":
-            example[field_name] = 4.5
-        elif field_name == "serving_size" and model_name == "NutritionInfo":
-            example[field_name] = "100g"
-        elif field_name == "serving_size" and model_name == "Recipe":
-            example[field_name] = 4
-        elif "_minutes" in field_name:
-            example[field_name] = 30
-        elif "_grams" in field_name:
-            example[field_name] = 10.5
-        elif field_name == "calories":
-            example[field_name] = 250
-    
-    return model_name, schema_json, example
+    return model_name, _SCHEMA_CACHE[model_name], _EXAMPLES[model_name]
 
 # function to display json schemas
 def show_json_schema():
@@ -314,9 +499,7 @@ def show_json_schema():
     print("\nJSON Schema Documentation")
     print("=" * 80)
     
-    models = [Recipe, Restaurant, NutritionInfo, QueryClassification]
-    
-    for model in models:
+    for model in _DOCUMENTED_MODELS:
         model_name, schema, example = generate_json_schema_docs(model)
         
         print(f"\n## {model_name} Schema:")
@@ -324,12 +507,18 @@ def show_json_schema():
         print(schema)
         
         print("\nExample Object:")
-        print(json.dumps(example, indent=2))
+        print(orjson.dumps(example, option=orjson.OPT_INDENT_2).decode())
         print("-" * 60)
     
     print("=" * 80)
 
-if __name__ == "__main__":
+# Concurrency cap for the demo driver, to stay inside the API rate limits
+MAX_CONCURRENT_QUERIES = 4
+
+# Query types answered with a structured output; everything else gets a streamed answer
+STRUCTURED_QUERY_TYPES = ("RECIPE", "RESTAURANT", "NUTRITION")
+
+async def main():
     # Example queries to test the system
     test_queries = [
         "How do I make a vegetarian lasagna?",  # Recipe
@@ -341,14 +530,56 @@ if __name__ == "__main__":
     print("\nTesting Food Chatbot with Structured Outputs")
     print("=" * 80)
     
-    for query in test_queries:
+    # Classify every query up front in a single request
+    query_types = await analyze_queries_batch(test_queries)
+    
+    # Structured queries run concurrently, at most MAX_CONCURRENT_QUERIES in flight,
+    # and each result is printed as soon as it is ready
+    sem = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
+    
+    async def _one(query, query_type):
+        async with sem:
+            return query, await process_food_query(query, query_type)
+    
+    classified = list(zip(test_queries, query_types))
+    structured = [(query, query_type) for query, query_type in classified if query_type in STRUCTURED_QUERY_TYPES]
+    for task in asyncio.as_completed([_one(query, query_type) for query, query_type in structured]):
+        query, response = await task
         print("\nTest Query:", query)
         print("-" * 60)
-        
-        response = process_food_query(query)
         print("\nResponse:")
         print(response)
         print("=" * 80)
     
+    # General queries are streamed to the terminal one at a time, so their text shows up
+    # at time-to-first-token without interleaving with other output
+    for query, query_type in classified:
+        if query_type in STRUCTURED_QUERY_TYPES:
+            continue
+        print("\nTest Query:", query)
+        print("-" * 60)
+        started = False
+        
+        def print_delta(delta):
+            nonlocal started
+            if not started:
+                print("\nResponse:")
+                started = True
+            print(delta, end="", flush=True)
+        
+        response = await process_food_query(query, query_type, on_delta=print_delta)
+        if not started:
+            # Nothing was streamed, e.g. the request failed
+            print("\nResponse:")
+            print(response, end="")
+        print()
+        print("=" * 80)
+    
+    # Keep the classified queries for the next run
+    save_semantic_cache()
+    
     # Show JSON schema examples
     show_json_schema()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,9 +1,37 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient, LengthFinishReasonError
 from dotenv import load_dotenv
+import diskcache
+import functools
+import hashlib
+import httpx
+import orjson
 import os
 
 load_dotenv()
-client = OpenAI()
+
+# Shared clients for the whole app: one keep-alive HTTP/2 connection pool each,
+# so concurrent requests reuse connections instead of paying a new TCP+TLS handshake.
+# Idle connections are kept for a minute (httpx drops them after 5s by default), so the
+# pool stays warm across the pauses between bursts, e.g. between optimization iterations
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=64, max_connections=128, keepalive_expiry=60.0)
+client = OpenAI(http_client=DefaultHttpxClient(http2=True, limits=HTTP_LIMITS))
+async_client = AsyncOpenAI(http_client=DefaultAsyncHttpxClient(http2=True, limits=HTTP_LIMITS))
+
+# Exact-match cache of structured outputs, so identical requests skip the API entirely
+_response_cache = diskcache.Cache(".llm_cache")
+
+@functools.cache
+def _schema_fingerprint(response_schema):
+    """Serialized JSON schema of a response model, built once per class since schema generation is expensive"""
+    return orjson.dumps(
+        [response_schema.__name__, response_schema.model_json_schema()],
+        option=orjson.OPT_SORT_KEYS
+    )
+
+def _structured_cache_key(query, system_message, response_schema, model="gpt-4o"):
+    """Key a structured output request by its model, prompt and the full response schema"""
+    payload = orjson.dumps([model, system_message, query]) + _schema_fingerprint(response_schema)
+    return hashlib.sha256(payload).hexdigest()
 
 # get chat completion from standard chat LLMs
 def get_chat_completion(messages, model="gpt-4o", temperature=0, tools=None, tool_choice=None):
@@ -35,88 +63,208 @@ def get_reasoning_response(messages, model="o1-mini", reasoning_effort="low"):
     )
     return response.choices[0].message.content
 
-def get_structured_output(query, system_message, response_schema, description="structured output"):
+def _optional_args(prompt_cache_key=None, max_completion_tokens=None):
+    """Keyword arguments for the optional request settings, only including the ones that are given"""
+    args = {}
+    if prompt_cache_key:
+        args["prompt_cache_key"] = prompt_cache_key
+    if max_completion_tokens:
+        args["max_completion_tokens"] = max_completion_tokens
+    return args
+
+# async variants for issuing many independent requests concurrently
+async def aget_reasoning_response(messages, model="o1-mini", reasoning_effort="low", prompt_cache_key=None):
+    """
+    Async version of get_reasoning_response
+    prompt_cache_key optionally routes requests sharing a prefix to the same cache
+    """
+    response = await async_client.chat.completions.create(
+        model=model,
+        messages=messages,
+        reasoning_effort=reasoning_effort,
+        **_optional_args(prompt_cache_key)
+    )
+    return response.choices[0].message.content
+
+async def aget_parsed_completion(messages, response_schema, model="gpt-4o", temperature=0, prompt_cache_key=None):
+    """
+    Async structured output call on a full messages list
+    Returns the parsed response object, or None if the model refused
+    """
+    completion = await async_client.beta.chat.completions.parse(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        response_format=response_schema,
+        **_optional_args(prompt_cache_key)
+    )
+    return completion.choices[0].message.parsed
+
+async def aget_embedding(text, model="text-embedding-3-small"):
+    """
+    Get the embedding vector for a piece of text
+    """
+    response = await async_client.embeddings.create(model=model, input=text)
+    return response.data[0].embedding
+
+async def aget_embeddings(texts, model="text-embedding-3-small"):
+    """
+    Get embedding vectors for several pieces of text in a single request
+    """
+    response = await async_client.embeddings.create(model=model, input=texts)
+    return [item.embedding for item in response.data]
+
+def _structured_request(query, system_message, response_schema, model="gpt-4o", prompt_cache_key=None, max_completion_tokens=None):
+    """Build the keyword arguments for a structured output request"""
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": query}
+        ],
+        "response_format": response_schema,
+        **_optional_args(prompt_cache_key, max_completion_tokens),
+    }
+
+
+def _structured_result(completion, key, return_cache_info):
+    """Extract the parsed response, store it in the disk cache and attach cache info if requested"""
+    parsed = completion.choices[0].message.parsed
+    if key and parsed is not None:
+        # Raw JSON bytes are stored as-is by diskcache and re-validated in one pass on a hit
+        _response_cache[key] = parsed.model_dump_json().encode()
+
+    if return_cache_info:
+        return parsed, extract_cache_info(getattr(completion, 'usage', None))
+    return parsed
+
+
+def _structured_failure(error, description, return_cache_info):
+    """Result for a failed structured output request, in the shape the caller asked for"""
+    if return_cache_info and isinstance(error, LengthFinishReasonError):
+        # Output was truncated by max_completion_tokens, but the prompt usage is still valid
+        return None, extract_cache_info(getattr(getattr(error, 'completion', None), 'usage', None))
+
+    print(f"Error with {description} response: {error}")
+    return (None, {}) if return_cache_info else None
+
+
+def get_structured_output(query, system_message, response_schema, description="structured output",
+                          model="gpt-4o", return_cache_info=False, prompt_cache_key=None, max_completion_tokens=None):
     """Generic function for getting structured outputs from OpenAI
+    Identical requests are answered from an on-disk cache without calling the API,
+    unless cache information is requested, since that describes a real API call.
     
     Args:
         query: The user query to process
         system_message: The system prompt to guide the model's response
         response_schema: The Pydantic model to use for structured output
         description: Description of the response type for error messages
+        model: The model to use
+        return_cache_info: Also return the prompt cache statistics of the call
+        prompt_cache_key: Optional key that routes requests sharing a prefix to the same cache
+        max_completion_tokens: Optional cap on generated tokens. If the cap cuts the output short,
+            the parsed response is None but the cache information is still returned
         
     Returns:
-        The parsed response object or None if an error occurred
+        The parsed response object or None if an error occurred. With return_cache_info,
+        a tuple of the parsed response and a dictionary with cache hit information
     """
-    messages = [
-        {"role": "system", "content": system_message},
-        {"role": "user", "content": query}
-    ]
+    key = None if return_cache_info else _structured_cache_key(query, system_message, response_schema, model)
+    if key:
+        cached = _response_cache.get(key)
+        if cached is not None:
+            return response_schema.model_validate_json(cached)
 
     try:
         # Using OpenAI's structured output API
         completion = client.beta.chat.completions.parse(
-            model="gpt-4o",
-            messages=messages,
-            response_format=response_schema,
+            **_structured_request(query, system_message, response_schema, model, prompt_cache_key, max_completion_tokens)
         )
-        
-        return completion.choices[0].message.parsed
     except Exception as e:
-        print(f"Error with {description} response: {e}")
-        return None
+        return _structured_failure(e, description, return_cache_info)
+
+    return _structured_result(completion, key, return_cache_info)
 
 
-def get_structured_output_with_cache_info(query, system_message, response_schema, description="structured output"):
-    """Enhanced function for getting structured outputs from OpenAI that also returns cache hit information
+async def aget_structured_output(query, system_message, response_schema, description="structured output",
+                                 model="gpt-4o", return_cache_info=False, prompt_cache_key=None, max_completion_tokens=None):
+    """Async version of get_structured_output
     
     Args:
         query: The user query to process
         system_message: The system prompt to guide the model's response
         response_schema: The Pydantic model to use for structured output
         description: Description of the response type for error messages
+        model: The model to use
+        return_cache_info: Also return the prompt cache statistics of the call
+        prompt_cache_key: Optional key that routes requests sharing a prefix to the same cache
+        max_completion_tokens: Optional cap on generated tokens
         
     Returns:
-        A tuple containing:
-        - The parsed response object or None if an error occurred
-        - A dictionary with cache hit information
+        The parsed response object or None if an error occurred. With return_cache_info,
+        a tuple of the parsed response and a dictionary with cache hit information
     """
-    messages = [
-        {"role": "system", "content": system_message},
-        {"role": "user", "content": query}
-    ]
+    key = None if return_cache_info else _structured_cache_key(query, system_message, response_schema, model)
+    if key:
+        cached = _response_cache.get(key)
+        if cached is not None:
+            return response_schema.model_validate_json(cached)
 
     try:
         # Using OpenAI's structured output API
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o",
-            messages=messages,
-            response_format=response_schema,
+        completion = await async_client.beta.chat.completions.parse(
+            **_structured_request(query, system_message, response_schema, model, prompt_cache_key, max_completion_tokens)
         )
-        
-        # Extract cache information from the response
-        cache_info = {}
-        if hasattr(completion, 'usage') and completion.usage:
-            usage = completion.usage
-            
-            # Get total prompt tokens (corresponds to total prompt input tokens and doesn't include completion tokens)
-            cache_info['total_prompt_tokens'] = usage.prompt_tokens
-            
-            # Get cached tokens information if available
-            if hasattr(usage, 'prompt_tokens_details') and usage.prompt_tokens_details:
-                if hasattr(usage.prompt_tokens_details, 'cached_tokens'):
-                    cache_info['cached_tokens'] = usage.prompt_tokens_details.cached_tokens
-                    cache_info['cache_hit_ratio'] = cache_info['cached_tokens'] / cache_info['total_prompt_tokens'] if cache_info['total_prompt_tokens'] > 0 else 0
-                    cache_info['is_cache_hit'] = cache_info['cached_tokens'] > 0
-        
-        return completion.choices[0].message.parsed, cache_info
     except Exception as e:
-        print(f"Error with {description} response: {e}")
-        return None, {}
+        return _structured_failure(e, description, return_cache_info)
+
+    return _structured_result(completion, key, return_cache_info)
 
 
+def extract_cache_info(usage):
+    """Extract prompt cache statistics from a response's usage block
+    
+    Handles both OpenAI usage (prompt_tokens already includes cached tokens) and
+    Anthropic usage (input_tokens excludes cache reads and writes, so all three are summed).
+    
+    Args:
+        usage: The usage object from a completion response, or None
+        
+    Returns:
+        A dictionary with total prompt tokens, cache read/write tokens, hit ratio and hit flag,
+        or an empty dictionary when no usage is available
+    """
+    if not usage:
+        return {}
+
+    if hasattr(usage, 'cache_read_input_tokens') or hasattr(usage, 'cache_creation_input_tokens'):
+        # Anthropic: uncached, cache-written and cache-read input tokens are reported separately
+        cache_read_tokens = getattr(usage, 'cache_read_input_tokens', 0) or 0
+        cache_write_tokens = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+        total_prompt_tokens = (getattr(usage, 'input_tokens', 0) or 0) + cache_read_tokens + cache_write_tokens
+    else:
+        # OpenAI: prompt_tokens is the total input, cached_tokens the part served from cache.
+        # Cache writes are not billed separately, so they are not reported.
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cache_read_tokens = (getattr(details, 'cached_tokens', 0) or 0) if details else 0
+        cache_write_tokens = 0
+        total_prompt_tokens = usage.prompt_tokens
+
+    return {
+        'total_prompt_tokens': total_prompt_tokens,
+        'cached_tokens': cache_read_tokens,
+        'cache_write_tokens': cache_write_tokens,
+        'cache_hit_ratio': cache_read_tokens / total_prompt_tokens if total_prompt_tokens > 0 else 0,
+        'is_cache_hit': cache_read_tokens > 0,
+    }
+
+
+@functools.cache
 def get_menu_items():
     """Returns a comprehensive list of menu items with detailed descriptions.
     This function centralizes all menu data to make it easier to maintain and extend.
+    The string is built at most once; use MENU_ITEMS / MENU_BY_NAME for structured lookups.
     
     Returns:
         str: A formatted string containing all menu items with their details
@@ -381,4 +529,25 @@ Included: Beef short ribs, mashed potatoes, roasted vegetables, red wine sauce
 Description: Tender beef slow-cooked for 12 hours in rich wine sauce
 Allergens: Contains dairy
 Preparation: Braised overnight for maximum tenderness
-"""
\ No newline at end of file
+"""
+
+
+def parse_menu_items(menu_text):
+    """Parse the menu text into one record per dish
+    
+    Args:
+        menu_text: Menu string in the format returned by get_menu_items
+        
+    Returns:
+        list[dict[str, str]]: One dictionary per dish, keyed by field name (e.g. "Food Item", "Price")
+    """
+    items = []
+    for block in menu_text.strip().split("\n\n"):
+        fields = (line.strip().split(": ", 1) for line in block.splitlines() if ": " in line)
+        items.append({key: value.strip() for key, value in fields})
+    return items
+
+
+# Menu parsed once at import, so dish details can be looked up locally without an LLM call
+MENU_ITEMS = parse_menu_items(get_menu_items())
+MENU_BY_NAME = {item["Food Item"]: item for item in MENU_ITEMS}